@@ -3,13 +3,56 @@ from pymongo import MongoClient
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from bson import Decimal128
-from decimal import Decimal
+from collections import Counter
+from itertools import chain
 import sys
 
 # Configuration
 DEFAULT_NUMERIC = 0.0
 MAX_SAMPLE_SIZE = 1000
+REVIEW_SCORE_FIELDS = [
+    'review_scores_accuracy', 'review_scores_cleanliness', 'review_scores_checkin',
+    'review_scores_communication', 'review_scores_location', 'review_scores_value'
+]
+
+def convert_field(path, to, default=DEFAULT_NUMERIC):
+    """$convert expression where null, missing or unconvertible values become default"""
+    return {"$convert": {"input": path, "to": to, "onError": default, "onNull": default}}
+
+# Server-side flattening: only the fields the dashboard renders leave MongoDB,
+# already converted to their target types with missing or bad values defaulted
+LISTING_PROJECTION = {
+    "_id": 0,
+    "price": convert_field("$price", "double"),
+    "cleaning_fee": convert_field("$cleaning_fee", "double"),
+    "review_rating": convert_field("$review_scores.review_scores_rating", "int"),
+    **{field: convert_field(f"$review_scores.{field}", "double", None) for field in REVIEW_SCORE_FIELDS},
+    "accommodates": convert_field("$accommodates", "int"),
+    "bedrooms": convert_field("$bedrooms", "int"),
+    "bathrooms": convert_field("$bathrooms", "double"),
+    "host_is_superhost": convert_field("$host.host_is_superhost", "bool", False),
+    "lat": convert_field({"$arrayElemAt": ["$address.location.coordinates", 1]}, "double", None),
+    "lon": convert_field({"$arrayElemAt": ["$address.location.coordinates", 0]}, "double", None),
+    "room_type": 1,
+    "property_type": 1,
+    "amenities": 1
+}
+LISTING_COLUMNS = [col for col in LISTING_PROJECTION if col != "_id"]
+
+# Values are converted in LISTING_PROJECTION, so numerics cast straight to compact
+# dtypes; smaller columns also shrink the payload Plotly sends to the browser
+LISTING_DTYPES = {
+    'price': 'float32',
+    'cleaning_fee': 'float32',
+    'bathrooms': 'float32',
+    'review_rating': 'int16',
+    'accommodates': 'int16',
+    'bedrooms': 'int16',
+    'host_is_superhost': 'bool',
+    **{field: 'float32' for field in REVIEW_SCORE_FIELDS},
+    'lat': 'float64',
+    'lon': 'float64'
+}
 
 @st.cache_resource
 def init_connection():
@@ -28,64 +71,59 @@ def init_connection():
 
 client = init_connection()
 
-def safe_convert(value):
-    if isinstance(value, Decimal128):
-        try: return float(value.to_decimal())
-        except: return DEFAULT_NUMERIC
-    return value
+@st.cache_data(ttl=60)
+def list_dbs():
+    return client.list_database_names()
 
-def safe_flatten(doc):
-    flat = {}
-    for key, value in doc.items():
-        try:
-            if isinstance(value, dict):
-                for sub_key, sub_value in value.items():
-                    flat[f"{key}_{sub_key}"] = safe_convert(sub_value)
-            else:
-                flat[key] = safe_convert(value)
-        except: pass
-    return flat
+@st.cache_data(ttl=60)
+def list_colls(db_name):
+    return client[db_name].list_collection_names()
 
 def safe_dataframe(data):
     try:
-        df = pd.DataFrame(data)
-        
-        numeric_config = [
-            ('price_$numberDecimal', 'price', float),
-            ('cleaning_fee_$numberDecimal', 'cleaning_fee', float),
-            ('review_scores_review_scores_rating_$numberInt', 'review_rating', int),
-            ('accommodates_$numberInt', 'accommodates', int),
-            ('bedrooms_$numberInt', 'bedrooms', int),
-            ('bathrooms_$numberDecimal', 'bathrooms', float),
-            ('host_host_is_superhost', 'host_is_superhost', bool)
-        ]
-        
-        for src, dest, dtype in numeric_config:
-            if src in df.columns:
-                df[dest] = pd.to_numeric(df[src], errors='coerce').fillna(DEFAULT_NUMERIC).astype(dtype)
-            else:
-                df[dest] = dtype(DEFAULT_NUMERIC)
-                
-        if 'address_location_coordinates' in df.columns:
-            df['coordinates'] = df['address_location_coordinates'].apply(
-                lambda x: (x[1], x[0]) if isinstance(x, list) and len(x)==2 else (None, None))
-            df[['lat', 'lon']] = pd.DataFrame(df['coordinates'].tolist(), index=df.index)
-            
-        return df
+        # Fixed column set from LISTING_PROJECTION; one astype to declared dtypes
+        # replaces per-column re-casting after pandas' own inference
+        df = pd.DataFrame.from_records(data, columns=LISTING_COLUMNS)
+        return df.astype(LISTING_DTYPES)
     except Exception as e:
         st.error(f"Data processing error: {str(e)}")
         return pd.DataFrame()
 
-def render_metrics(df):
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def load_sample(db_name, collection_name, limit=MAX_SAMPLE_SIZE):
+    collection = client[db_name][collection_name]
+    cursor = collection.aggregate([
+        {"$limit": limit},
+        {"$project": LISTING_PROJECTION}
+    ], batchSize=limit)
+    return safe_dataframe(list(cursor))
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def get_summary_metrics(db_name, collection_name):
+    collection = client[db_name][collection_name]
+    result = list(collection.aggregate([
+        {"$group": {
+            "_id": None,
+            "avg_price": {"$avg": convert_field("$price", "double", None)},
+            "avg_rating": {"$avg": "$review_scores.review_scores_rating"},
+            "pct_superhost": {"$avg": {"$cond": ["$host.host_is_superhost", 1, 0]}},
+            "avg_bedrooms": {"$avg": "$bedrooms"},
+            "avg_bathrooms": {"$avg": convert_field("$bathrooms", "double", None)}
+        }}
+    ]))
+    return result[0] if result else {}
+
+def render_metrics(db_name, collection_name):
     try:
         st.header("📊 Key Metrics")
+        summary = get_summary_metrics(db_name, collection_name)
         cols = st.columns(5)
         metrics = {
-            "Avg Price": f"${df['price'].mean():.2f}",
-            "Avg Rating": f"{df['review_rating'].mean():.0f}/100",
-            "Superhost %": f"{df['host_is_superhost'].mean()*100:.1f}%",
-            "Avg Bedrooms": f"{df['bedrooms'].mean():.1f}",
-            "Avg Bathrooms": f"{df['bathrooms'].mean():.1f}"
+            "Avg Price": f"${summary['avg_price']:.2f}",
+            "Avg Rating": f"{summary['avg_rating']:.0f}/100",
+            "Superhost %": f"{summary['pct_superhost']*100:.1f}%",
+            "Avg Bedrooms": f"{summary['avg_bedrooms']:.1f}",
+            "Avg Bathrooms": f"{summary['avg_bathrooms']:.1f}"
         }
         for (k, v), col in zip(metrics.items(), cols):
             col.metric(k, v)
@@ -103,10 +141,10 @@ def render_price_analysis(df):
 
 def render_review_analysis(df):
     try:
-        review_cols = [c for c in df.columns if c.startswith('review_scores_')]
+        review_cols = [c for c in REVIEW_SCORE_FIELDS if c in df.columns]
         if review_cols:
             st.header("⭐ Review Breakdown")
-            scores = df[review_cols].mean().reset_index()
+            scores = df[review_cols].mean(numeric_only=True).reset_index()
             scores.columns = ['Category', 'Score']
             
             fig = go.Figure()
@@ -121,9 +159,9 @@ def render_amenities(df):
     try:
         if 'amenities' in df.columns:
             st.header("🏆 Top Amenities")
-            amenities = df['amenities'].explode().value_counts().head(10)
-            fig = px.bar(amenities, orientation='h', 
-                         labels={'index':'Amenity', 'value':'Count'})
+            top = Counter(chain.from_iterable(df['amenities'].dropna())).most_common(10)
+            fig = px.bar(x=[count for _, count in top], y=[name for name, _ in top],
+                         orientation='h', labels={'y':'Amenity', 'x':'Count'})
             st.plotly_chart(fig)
     except: st.warning("Amenities analysis unavailable")
 
@@ -142,19 +180,16 @@ def main():
     try:
         st.title("🏠 Airbnb Analytics Dashboard")
         # Database/Collection selection
-        db_name = st.sidebar.selectbox("Select Database", client.list_database_names())
-        db = client[db_name]
-        collection_name = st.sidebar.selectbox("Select Collection", db.list_collection_names())
-        collection = db[collection_name]
+        db_name = st.sidebar.selectbox("Select Database", list_dbs())
+        collection_name = st.sidebar.selectbox("Select Collection", list_colls(db_name))
         
         try:
-            data = list(collection.find().limit(MAX_SAMPLE_SIZE))
-            df = safe_dataframe([safe_flatten(d) for d in data])
+            df = load_sample(db_name, collection_name)
         except Exception as e:
             st.error(f"Data load failed: {str(e)}")
             return
         
-        render_metrics(df)
+        render_metrics(db_name, collection_name)
         render_price_analysis(df)
         render_review_analysis(df)
         render_amenities(df)
@@ -0,0 +1,55 @@
+"""Translate custom field expressions into MongoDB aggregation expressions"""
+import ast
+
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+BINARY_OPERATORS = {
+    ast.Add: "$add",
+    ast.Sub: "$subtract",
+    ast.Mult: "$multiply",
+    ast.Div: "$divide",
+    ast.Mod: "$mod"
+}
+
+def to_mongo_expr(node):
+    """Translate a parsed expression node into a MongoDB aggregation expression"""
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return {BINARY_OPERATORS[type(node.op)]: [to_mongo_expr(node.left), to_mongo_expr(node.right)]}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return {"$multiply": [-1, to_mongo_expr(node.operand)]}
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        path = []
+        while isinstance(node, ast.Attribute):
+            path.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            raise ValueError("Unsupported field reference")
+        path.append(node.id)
+        return "$" + ".".join(reversed(path))
+    # Literal MongoDB expressions, e.g. {"$add": ["$price", "$cleaning_fee"]}
+    return ast.literal_eval(node)
+
+def validate_bson_value(value):
+    """Reject literals BSON cannot encode, e.g. sets, tuples and complex numbers"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise ValueError(f"Unsupported key: {key!r}")
+            validate_bson_value(item)
+    elif isinstance(value, list):
+        for item in value:
+            validate_bson_value(item)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        if not INT64_MIN <= value <= INT64_MAX:
+            raise ValueError(f"Integer out of range: {value}")
+    elif value is not None and not isinstance(value, (str, float, bool)):
+        raise ValueError(f"Unsupported value: {value!r}")
+    return value
+
+def parse_expression(expr):
+    """Parse a custom field expression without evaluating it as Python.
+
+    Accepts a literal MongoDB expression or arithmetic over field names,
+    e.g. ``price + cleaning_fee`` or ``host.listings_count * 2``.
+    """
+    return validate_bson_value(to_mongo_expr(ast.parse(expr, mode="eval").body))
@@ -3,8 +3,8 @@ from pymongo import MongoClient
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from bson import Decimal128
 import numpy as np
+from mongo_types import convert_decimals
 
 # Initialize session state
 if 'derived_fields' not in st.session_state:
@@ -17,39 +17,44 @@ def init_connection():
 
 client = init_connection()
 
-# Data processing functions
-def safe_flatten(doc):
-    flat = {}
-    for key, value in doc.items():
-        if isinstance(value, dict):
-            for sub_key, sub_value in value.items():
-                flat[f"{key}_{sub_key}"] = sub_value
-        else:
-            flat[key] = value
-    return flat
+@st.cache_data(ttl=60)
+def list_dbs():
+    return client.list_database_names()
 
-def convert_decimals(obj):
-    if isinstance(obj, Decimal128):
-        return float(obj.to_decimal())
-    return obj
+@st.cache_data(ttl=60)
+def list_colls(db_name):
+    return client[db_name].list_collection_names()
 
-# Main App
-def main():
-    st.title("🏠 Dynamic Airbnb Analytics")
-    
-    # Data Loading
-    db_name = st.sidebar.selectbox("Select Database", client.list_database_names())
-    db = client[db_name]
-    collection_name = st.sidebar.selectbox("Select Collection", db.list_collection_names())
-    collection = db[collection_name]
-    data = [convert_decimals(safe_flatten(doc)) for doc in collection.find().limit(1000)]
-    df = pd.DataFrame(data)
+# Data processing functions
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def load_sample(db_name, collection_name, limit=1000):
+    collection = client[db_name][collection_name]
+    # Embedded reviews are the bulk of each listing and are never charted
+    cursor = collection.find({}, {"reviews": 0}, batch_size=limit).limit(limit)
+    df = convert_decimals(pd.json_normalize(list(cursor), sep='_', max_level=1))
     
     # Convert numeric fields
     numeric_fields = ['price', 'cleaning_fee', 'accommodates', 'bedrooms']
     for field in numeric_fields:
         if field in df.columns:
             df[field] = pd.to_numeric(df[field], errors='coerce')
+    return df
+
+# Main App
+def main():
+    st.title("🏠 Dynamic Airbnb Analytics")
+    
+    # Data Loading
+    db_name = st.sidebar.selectbox("Select Database", list_dbs())
+    collection_name = st.sidebar.selectbox("Select Collection", list_colls(db_name))
+    df = load_sample(db_name, collection_name)
+    
+    # Re-apply stored derived fields so they survive reruns
+    for name, stored_formula in st.session_state.derived_fields.items():
+        try:
+            df[name] = df.eval(stored_formula)
+        except Exception as e:
+            st.warning(f"Couldn't apply derived field '{name}': {str(e)}")
     
     # Sidebar Controls
     st.sidebar.header("📊 Dashboard Configuration")
@@ -71,8 +76,8 @@ def main():
         chart_type = st.selectbox("Chart Type", 
             ["Scatter", "Bar", "Line", "Histogram", "Box", "Pie"])
         
-        available_fields = list(df.select_dtypes(include=np.number).columns) + \
-                          list(df.select_dtypes(exclude=np.number).columns)
+        numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+        available_fields = numeric_cols + [c for c in df.columns if c not in numeric_cols]
         
         x_axis = st.selectbox("X-Axis", available_fields)
         y_axis = st.selectbox("Y-Axis", available_fields, index=1) if chart_type not in ["Histogram", "Pie"] else None
@@ -84,15 +89,16 @@ def main():
     
     # Dynamic Metrics
     metric_fields = st.multiselect("Select Metrics", 
-                                 df.select_dtypes(include=np.number).columns.tolist(),
+                                 numeric_cols,
                                  default=['price', 'cleaning_fee'])
     
     if metric_fields:
+        stats = df[metric_fields].agg(['mean', 'min', 'max'])
         cols = st.columns(len(metric_fields))
         for idx, field in enumerate(metric_fields):
             with cols[idx]:
-                st.metric(f"Avg {field}", f"{df[field].mean():.2f}")
-                st.caption(f"Min: {df[field].min():.2f} | Max: {df[field].max():.2f}")
+                st.metric(f"Avg {field}", f"{stats.at['mean', field]:.2f}")
+                st.caption(f"Min: {stats.at['min', field]:.2f} | Max: {stats.at['max', field]:.2f}")
     
     # Dynamic Visualization
     st.header("Custom Visualization")
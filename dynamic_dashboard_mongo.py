@@ -1,46 +1,56 @@
 import streamlit as st
 from pymongo import MongoClient
+import pandas as pd
 import plotly.express as px
-from bson import Decimal128
 from collections import defaultdict
+from custom_expressions import parse_expression
+from mongo_types import convert_decimals
 
 # MongoDB Connection
 @st.cache_resource
-def init_connection():
-    return MongoClient(st.secrets.mongo.uri)
+def get_client(uri: str) -> MongoClient:
+    return MongoClient(uri)
+
+@st.cache_data(ttl=60)
+def list_dbs(uri):
+    return get_client(uri).list_database_names()
+
+@st.cache_data(ttl=60)
+def list_colls(uri, db_name):
+    return get_client(uri)[db_name].list_collection_names()
 
-#client = init_connection()
 with st.sidebar.expander("➕ Database Selection:"):
-    mongo_uri = st.text_input("Mongo URI")
-    if mongo_uri:
-        client = MongoClient(mongo_uri)
-    else:
-        client = MongoClient(st.secrets.mongo.uri)
+    mongo_uri = st.text_input("Mongo URI") or st.secrets.mongo.uri
+    client = get_client(mongo_uri)
     # Database/Collection selection
-    db_name = st.selectbox("Select Database", client.list_database_names())
-    db = client[db_name]
-    collection_name = st.selectbox("Select Collection", db.list_collection_names())
-    collection = db[collection_name]
+    db_name = st.selectbox("Select Database", list_dbs(mongo_uri))
+    collection_name = st.selectbox("Select Collection", list_colls(mongo_uri, db_name))
+    collection = client[db_name][collection_name]
     # Reset selections when database/collection changes
     if st.session_state.get("prev_db") != db_name or st.session_state.get("prev_collection") != collection_name:
         st.session_state.selected_metrics = []
         st.session_state.prev_db = db_name
         st.session_state.prev_collection = collection_name
 
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def sample_fields(uri, db_name, collection_name):
+    """Discover flattened field names from a sample of the collection"""
+    # Get sample documents to discover fields
+    sample_docs = list(get_client(uri)[db_name][collection_name].aggregate([
+        {"$sample": {"size": 10}},
+        {"$limit": 10}
+    ]))
+    
+    # Flatten nested documents
+    fields = set()
+    for doc in sample_docs:
+        fields.update(safe_flatten(doc).keys())
+    return tuple(sorted(fields))
+
 def get_available_fields():
     """Fetch available fields from MongoDB collection"""
     try:
-        # Get sample documents to discover fields
-        sample_docs = list(collection.aggregate([
-            {"$sample": {"size": 10}},
-            {"$limit": 10}
-        ]))
-        
-        # Flatten nested documents
-        fields = set()
-        for doc in sample_docs:
-            flattened = safe_flatten(doc)
-            fields.update(flattened.keys())
+        fields = set(sample_fields(mongo_uri, db_name, collection_name))
             
         # Add custom fields from session state
         fields.update(st.session_state.get("custom_fields", {}).keys())
@@ -53,20 +63,17 @@ def get_available_fields():
 def safe_flatten(doc, parent_key='', sep='_'):
     """Flatten nested dictionaries"""
     items = {}
-    for k, v in doc.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.update(safe_flatten(v, new_key, sep=sep))
-        else:
-            items[new_key] = v
+    stack = [(parent_key, doc)]
+    while stack:
+        prefix, current = stack.pop()
+        for k, v in current.items():
+            new_key = f"{prefix}{sep}{k}" if prefix else k
+            if isinstance(v, dict):
+                stack.append((new_key, v))
+            else:
+                items[new_key] = v
     return items
 
-# Helper to convert MongoDB types
-def convert_value(value):
-    if isinstance(value, Decimal128):
-        return float(value.to_decimal())
-    return value
-
 # Metric Configuration
 METRIC_OPERATIONS = {
     "Count": {"operator": "$sum", "value": 1, "requires_field": False},
@@ -77,25 +84,37 @@ METRIC_OPERATIONS = {
     "Unique Count": {"operator": "$addToSet", "value": "$value", "requires_field": True}
 }
 
-def validate_fields(data, required_fields):
-    missing = [field for field in required_fields if field not in data[0]]
+def validate_fields(df, required_fields):
+    missing = [field for field in required_fields if field not in df.columns]
     if missing:
         st.error(f"Missing fields: {', '.join(missing)}")
         return False
     return True
 
-def build_metric_group(field, metrics):
+def metric_key(field_idx, metric_idx):
+    """Positional $group output name; field names may contain '.' or collide once joined"""
+    return f"m{field_idx}_{metric_idx}"
+
+def build_metric_group(fields, metrics):
+    """Build one $group stage computing every (field, metric) pair"""
     group_stage = {"_id": None}
-    for metric in metrics:
-        config = METRIC_OPERATIONS[metric]
-        if metric == "Count":
-            group_stage[metric.lower()] = {config["operator"]: config["value"]}
-        else:
+    for i, field in enumerate(fields):
+        for j, metric in enumerate(metrics):
+            config = METRIC_OPERATIONS[metric]
+            value = config["value"]
             if config["requires_field"]:
-                value = config["value"].replace("$value", f"${field}")
-                group_stage[metric.lower()] = {config["operator"]: value}
+                value = value.replace("$value", f"${field}")
+            group_stage[metric_key(i, j)] = {config["operator"]: value}
     return group_stage
 
+def build_unique_count_stage(fields, metrics):
+    """Reduce $addToSet arrays to their sizes before they leave the server"""
+    j = metrics.index("Unique Count")
+    return {"$addFields": {
+        metric_key(i, j): {"$size": f"${metric_key(i, j)}"}
+        for i in range(len(fields))
+    }}
+
 # Main Application
 def main():
     st.title("🏠 Airbnb Analytics Dashboard")
@@ -115,6 +134,8 @@ def main():
         st.session_state.selected_color_field = ""
     if 'selected_size_field' not in st.session_state:
         st.session_state.selected_size_field = ""
+    if "custom_fields" not in st.session_state:
+        st.session_state.custom_fields = {}
 
     # Get available fields from MongoDB
     available_fields = get_available_fields()
@@ -129,8 +150,12 @@ def main():
         mongo_expr = st.text_input("MongoDB expression")
         if st.button("Add Field"):
             if new_field and mongo_expr:
-                st.session_state.custom_fields[new_field] = mongo_expr
-                st.rerun()
+                try:
+                    # Parsed once here; reruns reuse the stored MongoDB expression
+                    st.session_state.custom_fields[new_field] = parse_expression(mongo_expr)
+                    st.rerun()
+                except (SyntaxError, ValueError, TypeError) as e:
+                    st.error(f"Error in field '{new_field}': {str(e)}")
                 
     # Metric Selection
     metric_fields = st.sidebar.multiselect(
@@ -189,43 +214,30 @@ def main():
         # color_field = st.selectbox("Color Field", [None] + available_fields) if chart_type not in ["histogram", "pie"] else None
         # size_field = st.selectbox("Size Field", [None] + available_fields) if chart_type == "scatter" else None
 
-    # Initialize custom fields
-    if "custom_fields" not in st.session_state:
-        st.session_state.custom_fields = {}
-
     # Build base pipeline
-    pipeline = []
-    for field, expr in st.session_state.custom_fields.items():
-        try:
-            pipeline.append({"$addFields": {field: eval(expr)}})
-        except Exception as e:
-            st.error(f"Error in field '{field}': {str(e)}")
+    pipeline = [{"$addFields": {field: expr}} for field, expr in st.session_state.custom_fields.items()]
 
     # Metrics Calculation
     if metric_fields and metric_types:
         st.header("📊 Metrics Dashboard")
-        cols = st.columns(len(metric_fields))
         
-        for idx, field in enumerate(metric_fields):
-            with cols[idx]:
-                st.subheader(field.replace("_", " ").title())
-                
-                try:
-                    metric_pipeline = pipeline.copy()
-                    metric_pipeline.append({"$group": build_metric_group(field, metric_types)})
-                    result = list(collection.aggregate(metric_pipeline))[0]
-                    
-                    for metric in metric_types:
-                        if metric == "Count":
-                            value = result.get(metric.lower(), 0)
-                        elif metric == "Unique Count":
-                            value = len(result.get(metric.lower(), []))
-                        else:
-                            value = result.get(metric.lower(), 0)
+        try:
+            metric_pipeline = pipeline.copy()
+            metric_pipeline.append({"$group": build_metric_group(metric_fields, metric_types)})
+            if "Unique Count" in metric_types:
+                metric_pipeline.append(build_unique_count_stage(metric_fields, metric_types))
+            result = next(collection.aggregate(metric_pipeline), {})
+            
+            cols = st.columns(len(metric_fields))
+            for idx, field in enumerate(metric_fields):
+                with cols[idx]:
+                    st.subheader(field.replace("_", " ").title())
+                    for j, metric in enumerate(metric_types):
+                        value = result.get(metric_key(idx, j), 0)
                         st.metric(metric, f"{round(value, 2) if isinstance(value, float) else value}")
                         
-                except Exception as e:
-                    st.error(f"Metrics error: {str(e)}")
+        except Exception as e:
+            st.error(f"Metrics error: {str(e)}")
 
     # Visualization
     if x_field:
@@ -246,7 +258,7 @@ def main():
                 st.warning("No data available for visualization")
                 return
                 
-            data = [{k: convert_value(v) for k, v in doc.items()} for doc in results]
+            data = convert_decimals(pd.DataFrame(results))
             
             # Field validation
             required_fields = [x_field]
@@ -257,22 +269,23 @@ def main():
             if not validate_fields(data, required_fields):
                 return
 
-            # Create visualization
+            # Create visualization (only the selected chart is built)
             fig_map = {
-                "scatter": px.scatter(data, x=x_field, y=y_field, 
-                                    color=color_field, size=size_field),
-                "bar": px.bar(data, x=x_field, y=y_field, color=color_field),
-                "line": px.line(data, x=x_field, y=y_field, color=color_field),
-                "histogram": px.histogram(data, x=x_field, color=color_field),
-                "box": px.box(data, x=x_field, y=y_field, color=color_field),
-                "pie": px.pie(data, names=x_field, values=y_field)
+                "scatter": lambda: px.scatter(data, x=x_field, y=y_field, 
+                                            color=color_field, size=size_field),
+                "bar": lambda: px.bar(data, x=x_field, y=y_field, color=color_field),
+                "line": lambda: px.line(data, x=x_field, y=y_field, color=color_field),
+                "histogram": lambda: px.histogram(data, x=x_field, color=color_field),
+                "box": lambda: px.box(data, x=x_field, y=y_field, color=color_field),
+                "pie": lambda: px.pie(data, names=x_field, values=y_field)
             }
             
-            fig = fig_map.get(chart_type)
-            if fig:
+            build_fig = fig_map.get(chart_type)
+            if build_fig:
+                fig = build_fig()
                 st.plotly_chart(fig, use_container_width=True)
                 with st.expander("View Raw Data"):
-                    st.write(data[:100])
+                    st.write(data.head(100))
                     
         except Exception as e:
             st.error(f"Visualization error: {str(e)}")
@@ -0,0 +1,19 @@
+"""Convert MongoDB-specific value types in query results for pandas/Plotly"""
+import pandas as pd
+from bson import Decimal128
+
+NUMERIC_TYPES = {int, float, bool, type(None)}
+
+def convert_decimals(df):
+    """Convert Decimal128 values to floats, one object column at a time"""
+    for col in df.select_dtypes(include='object').columns:
+        # One C-level scan of the value types decides both whether and how to convert
+        value_types = set(map(type, df[col]))
+        if Decimal128 not in value_types:
+            continue
+        values = df[col].map(lambda v: float(v.to_decimal()) if isinstance(v, Decimal128) else v)
+        # Only columns that are otherwise numeric become a numeric dtype
+        if value_types - {Decimal128} <= NUMERIC_TYPES:
+            values = pd.to_numeric(values, errors='coerce')
+        df[col] = values
+    return df
@@ -0,0 +1,41 @@
+import unittest
+
+from custom_expressions import parse_expression
+
+
+class ParseExpressionTest(unittest.TestCase):
+    def test_arithmetic_over_fields(self):
+        self.assertEqual(parse_expression("price + cleaning_fee"),
+                         {"$add": ["$price", "$cleaning_fee"]})
+        self.assertEqual(parse_expression("host.listings_count * 2"),
+                         {"$multiply": ["$host.listings_count", 2]})
+        self.assertEqual(parse_expression("-price / 3"),
+                         {"$divide": [{"$multiply": [-1, "$price"]}, 3]})
+
+    def test_literal_mongo_expression(self):
+        self.assertEqual(parse_expression('{"$add": ["$price", 1.5, None, True]}'),
+                         {"$add": ["$price", 1.5, None, True]})
+
+    def test_rejects_code(self):
+        for expr in ['__import__("os").system("ls")', "price ** 2", "(1).real", "lambda: 1"]:
+            with self.subTest(expr=expr):
+                with self.assertRaises(ValueError):
+                    parse_expression(expr)
+
+    def test_rejects_syntax_errors(self):
+        with self.assertRaises(SyntaxError):
+            parse_expression("price +")
+
+    def test_rejects_values_bson_cannot_encode(self):
+        for expr in ["{1, 2}", "1j", "price + 1j", "(1, 2)", "{1: 2}", "2 ** 64", "[18446744073709551616]"]:
+            with self.subTest(expr=expr):
+                with self.assertRaises((ValueError, TypeError)):
+                    parse_expression(expr)
+
+    def test_unhashable_dict_key(self):
+        with self.assertRaises(TypeError):
+            parse_expression("{[1]: 2}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+import pandas as pd
+from bson import Decimal128
+
+from mongo_types import convert_decimals
+
+
+class ConvertDecimalsTest(unittest.TestCase):
+    def test_decimal_later_in_column(self):
+        df = convert_decimals(pd.DataFrame({"price": [None, None, Decimal128("12.50")]}))
+        self.assertEqual(df["price"].dtype, "float64")
+        self.assertTrue(df["price"].iloc[:2].isna().all())
+        self.assertEqual(df["price"].iloc[2], 12.5)
+
+    def test_mixed_int_and_decimal(self):
+        df = convert_decimals(pd.DataFrame({"price": [Decimal128("1.5"), 2, 3.25, None]}))
+        self.assertEqual(df["price"].dtype, "float64")
+        self.assertEqual(df["price"].iloc[:3].tolist(), [1.5, 2.0, 3.25])
+        self.assertTrue(pd.isna(df["price"].iloc[3]))
+
+    def test_non_numeric_column_with_decimal(self):
+        df = convert_decimals(pd.DataFrame({"mixed": ["n/a", Decimal128("4.0"), None]}))
+        self.assertEqual(df["mixed"].dtype, object)
+        self.assertEqual(df["mixed"].tolist(), ["n/a", 4.0, None])
+
+    def test_columns_without_decimals_untouched(self):
+        original = pd.DataFrame({"name": ["a", "b"], "tags": [["x"], ["y", "z"]], "n": [1, 2]})
+        df = convert_decimals(original.copy())
+        pd.testing.assert_frame_equal(df, original)
+
+
+if __name__ == "__main__":
+    unittest.main()